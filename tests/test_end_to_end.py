@@ -0,0 +1,198 @@
+import os
+import shutil
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+SCRIPT = os.path.join(os.path.dirname(__file__), os.pardir, "unzip-notion", "unzip-notion.py")
+# with --keep-tmp-folder, the tmp folder is copied there
+KEPT_TMP_FOLDER = os.path.join("/tmp", "unzip-notion")
+
+
+def make_export(tmp_path, files: dict[str, bytes]):
+    """
+    Write an export both as a source directory and as a zip file.
+
+    :param tmp_path: Directory of the test.
+    :param files: Content of the files of the export, by path.
+    :return: The path of the source directory and the path of the zip file.
+    """
+    source_dir = tmp_path / "export"
+    zip_path = tmp_path / "export.zip"
+    with zipfile.ZipFile(zip_path, "w") as zip_ref:
+        for path, content in files.items():
+            (source_dir / path).parent.mkdir(parents=True, exist_ok=True)
+            (source_dir / path).write_bytes(content)
+            zip_ref.writestr(path, content)
+    return source_dir, zip_path
+
+
+def run_unzip_notion(hugo_dir, *args: str, hash_seed: str = "0") -> subprocess.CompletedProcess:
+    """
+    Run the script on an export, and fail with its output if it does not exit with 0.
+
+    :param hugo_dir: Output directory.
+    :param args: Other arguments (options and input).
+    :param hash_seed: Value of PYTHONHASHSEED.
+    :return: The finished process.
+    """
+    hugo_dir.mkdir(exist_ok=True)
+    if "--keep-tmp-folder" in args and os.path.exists(KEPT_TMP_FOLDER):
+        pytest.skip(f"{KEPT_TMP_FOLDER} already exists")
+    try:
+        process = subprocess.run(
+            [sys.executable, SCRIPT, "-f", *map(str, args), str(hugo_dir)],
+            capture_output=True,
+            env={**os.environ, "PYTHONHASHSEED": hash_seed},
+        )
+    finally:
+        if "--keep-tmp-folder" in args:
+            shutil.rmtree(KEPT_TMP_FOLDER, ignore_errors=True)
+    assert process.returncode == 0, process.stderr.decode()
+    return process
+
+
+def read_tree(path) -> dict[str, bytes]:
+    return {
+        os.path.relpath(os.path.join(dir_path, file_name), path): open(os.path.join(dir_path, file_name), "rb").read()
+        for dir_path, _, file_names in os.walk(path)
+        for file_name in file_names
+    }
+
+
+@pytest.mark.parametrize("mode", ["source", "zip", "keep-tmp-folder"])
+def test_root_resource(tmp_path, mode):
+    source_dir, zip_path = make_export(
+        tmp_path,
+        {
+            "Root.md": b"# Root\n",
+            "cover.png": b"cover",
+            "Root/image.png": b"image",
+        },
+    )
+    args = {"source": ["-s", source_dir], "zip": [zip_path], "keep-tmp-folder": ["--keep-tmp-folder", zip_path]}
+    run_unzip_notion(tmp_path / "hugo", *args[mode])
+    assert read_tree(tmp_path / "hugo" / "static") == {"cover.png": b"cover", "image.png": b"image"}
+
+
+@pytest.mark.parametrize("mode", ["source", "zip"])
+def test_resources_with_same_repaired_name(tmp_path, mode):
+    # large enough for the copies to overlap if they are done concurrently
+    source_dir, zip_path = make_export(
+        tmp_path,
+        {
+            "Root.md": b"# Root\n",
+            "Root/Page.md": b"# Page\n",
+            "Root/Page/Big.png": b"B" * 30_000_000,
+            "Root/Page/big.png": b"b" * 10_000_000,
+        },
+    )
+    run_unzip_notion(tmp_path / "hugo", *(["-s", source_dir] if mode == "source" else [zip_path]))
+    # the last one in the order of the walk wins
+    assert read_tree(tmp_path / "hugo" / "static") == {os.path.join("page", "big.png"): b"b" * 10_000_000}
+
+
+def test_keep_tmp_folder_existing_destinations(tmp_path):
+    source_dir, zip_path = make_export(
+        tmp_path,
+        {
+            "Root.md": b"# Root\n",
+            "Root/Page.md": b"# Page\n",
+            # the directory and the file are both repaired to 'sub-a'
+            "Root/Page/Sub A.md": b"# Sub A\n",
+            "Root/Page/Sub A/image.png": b"image",
+            "Root/Page/sub-a": b"file",
+        },
+    )
+    run_unzip_notion(tmp_path / "source", "-s", source_dir)
+    # the second run replaces the linked files of the first one
+    for _ in range(2):
+        run_unzip_notion(tmp_path / "hugo", "--keep-tmp-folder", zip_path)
+    assert read_tree(tmp_path / "hugo") == read_tree(tmp_path / "source")
+
+
+def test_dm_tags_order(tmp_path):
+    source_dir, _ = make_export(
+        tmp_path,
+        {
+            "DM 01.md": b"# DM 01\n",
+            "DM 01/Exercice 1.md": b"# Exercice 1\n~~crit Zeta crit Alpha crit Mu crit Beta crit Gamma~~\n",
+            "DM 01/Exercice 2.md": b"# Exercice 2\n~~crit Omega crit Delta~~\n",
+        },
+    )
+    # the order of the tags of a page must not depend on the hash randomisation
+    dm_pages = set()
+    for hash_seed in ("1", "2", "3", "4"):
+        run_unzip_notion(tmp_path / hash_seed, "--dm", "-s", source_dir, hash_seed=hash_seed)
+        dm_pages.add((tmp_path / hash_seed / "content" / "dm-01" / "_index.md").read_bytes())
+    assert len(dm_pages) == 1
+    assert dm_pages.pop().endswith(
+        b"## Crit\xc3\xa8res\n\n"
+        b"1. [Alpha](/dm-01/exercice-1#Alpha)\n"
+        b"2. [Beta](/dm-01/exercice-1#Beta)\n"
+        b"3. [Gamma](/dm-01/exercice-1#Gamma)\n"
+        b"4. [Mu](/dm-01/exercice-1#Mu)\n"
+        b"5. [Zeta](/dm-01/exercice-1#Zeta)\n"
+        b"6. [Delta](/dm-01/exercice-2#Delta)\n"
+        b"7. [Omega](/dm-01/exercice-2#Omega)\n"
+    )
+
+
+def front_matter(page: bytes) -> dict[bytes, bytes]:
+    header = page.split(b"---\n")[1]
+    return dict(line.split(b": ", 1) for line in header.splitlines())
+
+
+def test_source_and_zip(tmp_path):
+    source_dir, zip_path = make_export(
+        tmp_path,
+        {
+            "Cours.md": b"# Cours\n[DM 1](Cours/DM%201.md)\n",
+            "Cours/DM 1.md": b"# DM 1\n"
+            b"![Schema](DM%201/Schema.png)\n"
+            b"[Exercice 2](DM%201/Exercice%202.md)\n"
+            b"[Exercice 1](DM%201/Exercice%201.md)\n",
+            "Cours/DM 1/Schema.png": b"png",
+            "Cours/DM 1/Exercice 1.md": "# Exercice 1\n~~crit Rigueur crit Clarté~~\n".encode(),
+            "Cours/DM 1/Exercice 2.md": b"# Exercice 2\n"
+            b"![img](Exercice%202/photo.jpg)\n"
+            b"[Partie B](Exercice%202/Partie%20B.md)\n"
+            b"[Partie A](Exercice%202/Partie%20A.md)\n",
+            "Cours/DM 1/Exercice 2/photo.jpg": b"jpg",
+            "Cours/DM 1/Exercice 2/Partie A.md": b"# Partie A\n~~crit Rigueur~~\n",
+            "Cours/DM 1/Exercice 2/Partie B.md": b"# Partie B\n",
+        },
+    )
+    run_unzip_notion(tmp_path / "source", "-s", source_dir)
+    run_unzip_notion(tmp_path / "zip", zip_path)
+    output = read_tree(tmp_path / "source")
+    assert read_tree(tmp_path / "zip") == output
+
+    # the weights are given by the order of the links in the parent page
+    pages = {
+        os.path.dirname(path).removeprefix("content").strip(os.sep): front_matter(content)
+        for path, content in output.items()
+        if path.startswith("content")
+    }
+    assert {page: header[b"weight"] for page, header in pages.items()} == {
+        "": b"99",
+        "dm-1": b"99",
+        os.path.join("dm-1", "exercice-1"): b"2",
+        os.path.join("dm-1", "exercice-2"): b"1",
+        os.path.join("dm-1", "exercice-2", "partie-a"): b"2",
+        os.path.join("dm-1", "exercice-2", "partie-b"): b"1",
+    }
+    assert {page: header[b"tags"] for page, header in pages.items()} == {
+        "": b"[  ]",
+        "dm-1": b"[  ]",
+        os.path.join("dm-1", "exercice-1"): '[ "Clarté", "Rigueur" ]'.encode(),
+        os.path.join("dm-1", "exercice-2"): b"[  ]",
+        os.path.join("dm-1", "exercice-2", "partie-a"): b'[ "Rigueur" ]',
+        os.path.join("dm-1", "exercice-2", "partie-b"): b"[  ]",
+    }
+    assert {path: content for path, content in output.items() if path.startswith("static")} == {
+        os.path.join("static", "dm-1", "schema.png"): b"png",
+        os.path.join("static", "dm-1", "exercice-2", "photo.jpg"): b"jpg",
+    }
@@ -0,0 +1,39 @@
+import random
+import re
+import sys
+import os
+
+import pytest
+
+re2 = pytest.importorskip("re2")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "unzip-notion"))
+unzip_notion = __import__("unzip-notion")
+
+RE2_PATTERN = unzip_notion.MARKDOWN_LINK_OR_CRIT_PATTERN
+RE_PATTERN = re.compile(RE2_PATTERN.pattern)
+
+# Pieces of markdown, with non-UTF-8 bytes (latin-1 é, lone continuation and 0xff bytes)
+PIECES = [b"[", b"]", b"(", b")", b".md", b".png", b"~~", b"crit ", b" ", b"x", b"\n", b".", b"\xe9", b"\xff", b"\x80",
+          b"\xc3\xa9"]
+
+
+def spans(pattern, content):
+    return [(match.span(), match.lastindex) for match in pattern.finditer(content)]
+
+
+@pytest.mark.parametrize("content", [
+    b"~~crit caf\xe9~~",
+    b"[caf\xe9](Caf\xe9%20abc.md)",
+    b"[see ~~crit x~~](foo\xff.md) ~~crit \x80~~",
+])
+def test_non_utf8_content(content):
+    assert spans(RE2_PATTERN, content) == spans(RE_PATTERN, content)
+    assert spans(RE2_PATTERN, content)
+
+
+def test_random_content():
+    generator = random.Random(0)
+    for _ in range(20000):
+        content = b"".join(generator.choices(PIECES, k=generator.randint(0, 30)))
+        assert spans(RE2_PATTERN, content) == spans(RE_PATTERN, content), content
@@ -0,0 +1,117 @@
+import os
+import shutil
+import zipfile
+from typing import NamedTuple
+
+# Same as what zipfile.ZipFile.extractall ignores in member paths
+INVALID_PATH_PARTS = (b"", b".", b"..")
+# Buffer size for copying files (larger than the default of shutil, to reduce the number of read/decompress calls)
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class ArchiveEntry(NamedTuple):
+    """
+    File or directory of a zip archive. This mimics the parts of `os.DirEntry` that are used when walking the input.
+    """
+
+    name: bytes
+    path: bytes
+    info: zipfile.ZipInfo | None  # None for directories
+
+    def is_dir(self) -> bool:
+        return self.info is None
+
+    def is_file(self) -> bool:
+        return self.info is not None
+
+
+class Archive:
+    """
+    Zip archive that can be walked and read like a directory, without extracting it first.
+    Paths are relative to the root of the archive (the root itself is b"").
+    """
+
+    def __init__(self, zip_ref: zipfile.ZipFile) -> None:
+        self.zip_ref = zip_ref
+        self.dirs: dict[bytes, list[ArchiveEntry]] = {b"": []}
+        self.files: dict[bytes, zipfile.ZipInfo] = dict()
+        for info in zip_ref.infolist():
+            path_parts = [
+                part
+                for part in os.fsencode(info.filename).split(b"/")
+                if part not in INVALID_PATH_PARTS
+            ]
+            if not path_parts:
+                continue
+            path = b"/".join(path_parts)
+            if info.is_dir():
+                self._add_dir(path)
+            elif path not in self.files:
+                self._add_dir(os.path.dirname(path))
+                self.files[path] = info
+                self.dirs[os.path.dirname(path)].append(
+                    ArchiveEntry(path_parts[-1], path, info)
+                )
+
+    def _add_dir(self, path: bytes) -> None:
+        """
+        Register a directory, and its parent directories (zip files do not always contain directory entries).
+
+        :param path: Path of the directory.
+        """
+        if path in self.dirs:
+            return
+        parent = os.path.dirname(path)
+        self._add_dir(parent)
+        self.dirs[path] = []
+        self.dirs[parent].append(ArchiveEntry(os.path.basename(path), path, None))
+
+    def scandir(self, path: bytes) -> list[ArchiveEntry]:
+        """
+        List the entries of a directory of the archive.
+
+        :param path: Path of the directory.
+        :return: Entries of the directory.
+        """
+        if path not in self.dirs:
+            raise NotADirectoryError(f"{path} (in {self.zip_ref.filename})")
+        return list(self.dirs[path])
+
+    def read(self, path: bytes) -> bytes:
+        """
+        Read the (decompressed) content of a file of the archive.
+
+        :param path: Path of the file.
+        :return: Content of the file.
+        """
+        return self.zip_ref.read(self.files[path])
+
+    def copy(self, path: bytes, dst: bytes) -> None:
+        """
+        Decompress a file of the archive directly to its destination.
+
+        :param path: Path of the file.
+        :param dst: Destination path.
+        """
+        info = self.files[path]
+        with self.zip_ref.open(info) as infile, open(dst, "wb") as outfile:
+            # small files are read in one go, without allocating a full buffer
+            shutil.copyfileobj(infile, outfile, min(info.file_size, COPY_BUFFER_SIZE))
+
+    def extractall(self, dst: bytes) -> None:
+        """
+        Extract the whole archive, like `zipfile.ZipFile.extractall`, but with larger buffers.
+        Empty files are created without being opened in the archive.
+
+        :param dst: Path of the destination directory.
+        """
+        for path in self.dirs:
+            os.makedirs(os.path.join(dst, path), exist_ok=True)
+        for path, info in self.files.items():
+            if info.file_size == 0:
+                open(os.path.join(dst, path), "wb").close()
+            else:
+                self.copy(path, os.path.join(dst, path))
+
+    def close(self) -> None:
+        self.zip_ref.close()
@@ -1,34 +1,93 @@
 import argparse
+import concurrent.futures
+import functools
+import itertools
 import logging
 import re
 import os
 import shutil
+import string
 import sys
 import tempfile
 import urllib
 import urllib.parse
 import zipfile
+from typing import NamedTuple
 
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+from archive import Archive, ArchiveEntry
 from logger import logger
-from weights import set_weights, DEFAULT_WEIGHT
-from utils import get_exit_status, replace_match
+from weights import link_order_from_content, set_page_weight, DEFAULT_WEIGHT
+from utils import get_exit_status, set_exit_status
 
 
 FILE_HASH_SUFFIX_PATTERN = re.compile(b"(.*)( [0-9a-z]{32})(\\.md)?$")
 MARKDOWN_HASH_SUFFIX_PATTERN = re.compile(b"%20[0-9a-z]{32}")
-MARKDOWN_MD_LINK_PATTERN = re.compile(b"\\[(?P<name>[^]]*)]\\((?P<url>[^)]*\\.md)\\)")
-# This also matches markdown files. Therefore, markdown files should be processed before
-MARKDOWN_RESOURCE_LINK_PATTERN = re.compile(
-    b"\\[(?P<name>[^]]*)]\\((?P<url>[^)]*\\.(?!md)[^.\n)]+)\\)"
+# Matches both Markdown links (the url ends with '.md') and Resource links (any other extension, except the ones
+# starting with 'md', like '.mdx'). The extension is spelled out without a lookahead: 'md', 'm' not followed by 'd',
+# or anything not starting with 'm'
+MARKDOWN_LINK_PATTERN = re.compile(
+    b"\\[(?P<name>[^]]*)]\\((?P<url>[^)]*\\.(?:md|m(?:[^d.\n)][^.\n)]*)?|[^m.\n)][^.\n)]*))\\)"
 )
-MARKDOWN_H1_PATTERN = re.compile(b"^# +(?P<title>.+)\r?(\n|$)")
+MARKDOWN_H1_PATTERN = re.compile(b"^# +(?P<title>.+)\r?(?:\n|$)")
 MARKDOWN_CRIT_PATTERN = re.compile(b"~~[ \t]*(?P<crit_group>crit[ \t]+[^~]+)~~[ \t]*\n?")
-MARKDOWN_CRIT_PATTERN_SELF = re.compile(b"crit[ \t]+(?P<crit>((?!crit)[^~])+)")
-
-g_all_dm_tags = dict()
-g_dm_tags = dict()
-
-
+# Links and crits are repaired in a single scan of the content
+MARKDOWN_LINK_OR_CRIT_PATTERN = re.compile(
+    b"(?P<crit>"
+    + MARKDOWN_CRIT_PATTERN.pattern
+    + b")|(?P<link>"
+    + MARKDOWN_LINK_PATTERN.pattern
+    + b")"
+)
+# The groups are accessed by index: this is faster than by name, and re2 names the groups of bytes patterns with
+# bytes (unlike re)
+CRIT_CONTENT_GROUP, LINK_GROUP, LINK_NAME_GROUP, LINK_URL_GROUP = (
+    MARKDOWN_LINK_OR_CRIT_PATTERN.groupindex[group_name] for group_name in ("crit_group", "link", "name", "url")
+)
+# The content is scanned with re2 if it is installed (linear time, even on malformed content). re2 works on UTF-8
+# by default, where character classes such as [^~] do not match invalid UTF-8 bytes: the pattern is compiled in
+# Latin-1 mode instead, so that every byte is a character (as with re)
+if re2 is not None:
+    RE2_OPTIONS = re2.Options()
+    RE2_OPTIONS.encoding = re2.Options.Encoding.LATIN1
+    MARKDOWN_LINK_OR_CRIT_PATTERN = re2.compile(MARKDOWN_LINK_OR_CRIT_PATTERN.pattern, RE2_OPTIONS)
+MARKDOWN_CRIT_PATTERN_SELF = re.compile(b"crit[ \t]+(?P<crit>(?:(?!crit)[^~])+)")
+CRIT_SELF_GROUP = MARKDOWN_CRIT_PATTERN_SELF.groupindex["crit"]
+# Accents and special characters in file names. Both decomposed forms of 'é' are folded directly into 'e'
+FILE_NAME_SUBSTITUTIONS = {
+    b"e\xa6\xfc": b"e",
+    b"e\xcc\x81": b"e",
+    b"\xc3\xa9": b"e",
+    b"\xc3\xa7": b"c",
+    b"\xe2\x80\x99": b"_",
+}
+FILE_NAME_SUBSTITUTIONS_PATTERN = re.compile(
+    b"|".join(map(re.escape, FILE_NAME_SUBSTITUTIONS))
+)
+# Same as FILE_NAME_SUBSTITUTIONS, for (lower-cased) url-encoded names
+URL_SUBSTITUTIONS = {
+    b"%20": b" ",
+    b"e%cc%81": b"e",
+    b"%e2%80%99": b"_",
+    b"&": b"et",
+    b",": b"_",
+}
+URL_SUBSTITUTIONS_PATTERN = re.compile(b"|".join(map(re.escape, URL_SUBSTITUTIONS)))
+# Bytes that are never quoted by urllib.parse.quote_from_bytes (with its default safe characters)
+URL_SAFE_BYTES = bytes(string.ascii_letters + string.digits + "_.-~/", "ascii")
+# Quoted form of every byte (same as urllib.parse.quote_from_bytes)
+URL_QUOTE_TABLE = tuple(bytes([byte]) if byte in URL_SAFE_BYTES else b"%%%02X" % byte for byte in range(256))
+# Runs of spaces and dashes in urls, which are collapsed into a single dash
+URL_SEPARATORS_PATTERN = re.compile(b"[ -]+")
+# Prefixes of urls that obviously point outside of the export
+EXTERNAL_URL_PREFIXES = (b"http://", b"https://", b"ftp://", b"mailto:", b"//")
+
+
+@functools.lru_cache(maxsize=None)
 def repair_name(name: bytes) -> bytes:
     """
     Removes the hash suffix and replaces accents in file names.
@@ -36,17 +95,16 @@ def repair_name(name: bytes) -> bytes:
     :param name: Name of a file.
     :return: Repaired name of the file.
     """
-    return re.sub(
-        FILE_HASH_SUFFIX_PATTERN,
-        b"\\1\\3",
-        name.replace(b"e\xa6\xfc", b"\xc3\xa9")
-        .replace(b"e\xcc\x81", b"\xc3\xa9")
-        .replace(b"\xc3\xa9", b"e")
-        .replace(b"\xc3\xa7", b"c")
-        .replace(b"\xe2\x80\x99", b"_"),
+    name = FILE_NAME_SUBSTITUTIONS_PATTERN.sub(
+        lambda re_match: FILE_NAME_SUBSTITUTIONS[re_match[0]], name
     )
+    # the hash suffix is separated by a space: no need to run the regex otherwise
+    if b" " in name:
+        name = FILE_HASH_SUFFIX_PATTERN.sub(b"\\1\\3", name)
+    return name
 
 
+@functools.lru_cache(maxsize=None)
 def repair_url_part(url_part: bytes) -> bytes:
     """
     Repair an url, or a part of an url that points to a markdown file.
@@ -55,69 +113,121 @@ def repair_url_part(url_part: bytes) -> bytes:
     :param url_part: Part of an url.
     :return: Repaired url.
     """
-    url_part = re.sub(MARKDOWN_HASH_SUFFIX_PATTERN, b"", url_part)
-    url_part = url_part.lower()
-    for old, new in [(b"%20", b" "), (b"e%cc%81", b"e"), (b"%e2%80%99", b"_"), (b"&", b"et"), (b",", b"_")]:
-        url_part = url_part.replace(old, new)
-    url_words = url_part.split(b" ")
-    return b"-".join(filter(lambda word: word != b"-", url_words))
+    # same as in `repair_name`, with an url-encoded space
+    if b"%20" in url_part:
+        url_part = MARKDOWN_HASH_SUFFIX_PATTERN.sub(b"", url_part)
+    url_part = URL_SUBSTITUTIONS_PATTERN.sub(
+        lambda re_match: URL_SUBSTITUTIONS[re_match[0]], url_part.lower()
+    )
+    return URL_SEPARATORS_PATTERN.sub(b"-", url_part).strip(b"-")
 
 
-def repair_link(
-    link_match: re.Match[bytes],
+def quote_url_part(url_part: bytes) -> bytes:
+    """
+    Same as `urllib.parse.quote_from_bytes`, but returns bytes. When spaces are the only characters to quote
+    (which is the usual case for file names), the url part is not quoted byte per byte.
+
+    :param url_part: Part of an url.
+    :return: Quoted url part.
+    """
+    if not url_part.translate(None, URL_SAFE_BYTES + b" "):
+        return url_part.replace(b" ", b"%20")
+    return b"".join(map(URL_QUOTE_TABLE.__getitem__, url_part))
+
+
+def unquote_url_part(url_part: bytes) -> bytes:
+    """
+    Same as `urllib.parse.unquote_to_bytes`, for parts of urls that usually contain nothing to unquote.
+
+    :param url_part: Part of an url.
+    :return: Unquoted url part.
+    """
+    if b"%" not in url_part:
+        return url_part
+    return urllib.parse.unquote_to_bytes(url_part)
+
+
+@functools.lru_cache(maxsize=2048)
+def repair_url(
+    url: bytes,
     old_link_prefix: bytes,
-    parent_link_prefixes: list[bytes] | None = None,
-    url_prefix: list[bytes] | None = None,
+    parent_link_prefixes: frozenset[bytes] = frozenset(),
+    url_prefix: tuple[bytes, ...] = (),
     md_link: bool = True,
-) -> bytes:
+) -> bytes | None:
     """
-    Repair a Markdown or Resource link.
+    Repair the url of a Markdown or Resource link. The same urls appear in many links, so the results are cached.
 
-    :param link_match: regex match object for a Markdown or Resource link
+    :param url: url of the link
     :param old_link_prefix: prefix that must be removed
     :param parent_link_prefixes: prefixes that are not valid
-    :param url_prefix: a prefix to add the resulting url
-    :param md_link: the match matches a Markdown link (not a Resource link)
-    :return: the link with a repaired url part
+    :param url_prefix: an (already repaired) prefix to add the resulting url
+    :param md_link: the url is the url of a Markdown link (not a Resource link)
+    :return: the repaired url, or None if the url is external (it must be left untouched)
     """
-    if not parent_link_prefixes:
-        parent_link_prefixes = []
-    if not url_prefix:
-        url_prefix = []
-
-    name = link_match.group("name")
-    url = link_match.group("url")
-
-    try:
-        url_parse_result = urllib.parse.urlparse(url)
-    except UnicodeDecodeError as err:
-        print(f'Failed to parse "{url}" with urllib.parse.urlparse', file=sys.stderr)
-    else:
-        if all([url_parse_result.scheme, url_parse_result.netloc]):
-            return link_match.group(0)
+    # external links are left untouched
+    if url.startswith(EXTERNAL_URL_PREFIXES):
+        return None
+    # an url can only have both a scheme and a netloc if it contains '://'
+    if b"://" in url:
+        try:
+            url_parse_result = urllib.parse.urlparse(url)
+        except UnicodeDecodeError as err:
+            print(f'Failed to parse "{url}" with urllib.parse.urlparse', file=sys.stderr)
+        else:
+            if all([url_parse_result.scheme, url_parse_result.netloc]):
+                return None
 
     if md_link:
         url = url.removesuffix(b".md")
-    url_parts = url.removeprefix(b"/").split(b"/")
+    # there is always at least one part
+    url_parts = [repair_url_part(url_part) for url_part in url.removeprefix(b"/").split(b"/")]
+    if url_prefix:
+        url_parts = [*url_prefix, *url_parts]
+
+    # Rebuild new url (the first part decides how the url starts)
+    first_url_part = url_parts[0]
+    if first_url_part == old_link_prefix:
+        new_url_parts = url_parts[1:]
+    elif first_url_part == b".." or first_url_part in parent_link_prefixes:
+        new_url_parts = [b"..", *url_parts]
+    else:
+        new_url_parts = url_parts
 
-    # Rebuild new url
-    new_url_parts = list(map(repair_url_part, url_prefix + url_parts))
-    if new_url_parts:
-        if new_url_parts[0] == old_link_prefix:
-            new_url_parts.pop(0)
-        elif new_url_parts[0] == b".." or new_url_parts[0] in parent_link_prefixes:
-            new_url_parts.insert(0, b"..")
+    return b"/".join(new_url_parts)
 
-    new_url = b"/".join(new_url_parts)
-    logger.debug(f"Fixing link: {new_url} (old: {url})")
-    return b"[" + name + b"](" + new_url + b")"
+
+def repair_link(
+    link_match: re.Match[bytes],
+    old_link_prefix: bytes,
+    parent_link_prefixes: frozenset[bytes] = frozenset(),
+    url_prefix: tuple[bytes, ...] = (),
+    md_link: bool = True,
+) -> bytes:
+    """
+    Repair a Markdown or Resource link (see `repair_url`).
+
+    :param link_match: regex match object for a Markdown or Resource link (see `MARKDOWN_LINK_OR_CRIT_PATTERN`)
+    :param old_link_prefix: prefix that must be removed
+    :param parent_link_prefixes: prefixes that are not valid
+    :param url_prefix: an (already repaired) prefix to add the resulting url
+    :param md_link: the match matches a Markdown link (not a Resource link)
+    :return: the link with a repaired url part
+    """
+    url = link_match[LINK_URL_GROUP]
+    new_url = repair_url(url, old_link_prefix, parent_link_prefixes, url_prefix, md_link)
+    if new_url is None:
+        return link_match[0]
+    logger.debug("Fixing link: %s (old: %s)", new_url, url)
+    return b"[" + link_match[LINK_NAME_GROUP] + b"](" + new_url + b")"
 
 
 def repair_content(
     content: bytes,
     src: bytes,
     dst: bytes,
-    resource_dir_names: list[bytes] | None = None,
+    resource_dir_names: frozenset[bytes] = frozenset(),
+    weight: bytes = DEFAULT_WEIGHT,
 ) -> tuple[bytes, set[bytes]]:
     """
     The content of a markdown file is 'repaired'. The following changes are applied:
@@ -133,88 +243,81 @@ def repair_content(
     :param src: Path of the source file.
     :param dst: Destination path of the markdown file.
     :param resource_dir_names: Directory names of other markdown resource files.
+    :param weight: Weight of the page (see `weights.link_order_from_content`).
     :return: A tuple. The first element is the output content. The second element is the tags that have been found in the content.
     """
     file_basename = os.path.basename(src).removesuffix(b".md")
 
-    # extract title
-    title_match = MARKDOWN_H1_PATTERN.search(content)
+    # extract title (the content then starts after it)
+    content_start = 0
+    # the pattern is anchored at the start of the content (no re.MULTILINE), so it can only match there
+    title_match = MARKDOWN_H1_PATTERN.match(content) if content.startswith(b"# ") else None
     if title_match:
         title = title_match.group("title")
-        content = content[title_match.end() :]
+        content_start = title_match.end()
     else:
         logger.warning(
             f"Could not find title for {dst}. Using file basename {file_basename}"
         )
         title = file_basename
 
-    old_link_prefix = repair_url_part(
-        bytes(urllib.parse.quote_from_bytes(file_basename), "utf-8")
-    )
-    # repair Resource links
-    resource_match_offset = 0
-    for re_match_group in MARKDOWN_RESOURCE_LINK_PATTERN.finditer(content):
-        repaired_link = repair_link(
-            re_match_group, old_link_prefix, resource_dir_names, md_link=False
-        )
-        content, resource_match_offset = replace_match(
-            re_match_group, repaired_link, content, resource_match_offset
-        )
-
-    # repair Markdown links
-    md_match_offset = 0
-    for re_match_group in MARKDOWN_MD_LINK_PATTERN.finditer(content):
-        repaired_link = repair_link(re_match_group, old_link_prefix, resource_dir_names)
-        content, md_match_offset = replace_match(
-            re_match_group, repaired_link, content, md_match_offset
-        )
-
-    # tags & crit
+    old_link_prefix = repair_url_part(quote_url_part(file_basename))
+    # repair Markdown & Resource links, and process the tags & crits (in a single scan of the content)
     tags: set[bytes] = set()
-    crit_match_offset = 0
-    for re_match_group in MARKDOWN_CRIT_PATTERN.finditer(content):
-        crit_group = re_match_group.group("crit_group").strip().replace(b'"', b"").replace(b"\n", b"")
+
+    def repair_crit(crit_group: bytes) -> bytes:
+        crit_group = crit_group.strip().replace(b'"', b"").replace(b"\n", b"")
         # remove links INSIDE crits/tags (yes, sometimes that happens :/)
-        crit_link_match_offset = 0
-        for link_inside_crit_match in MARKDOWN_RESOURCE_LINK_PATTERN.finditer(crit_group):
-            crit_group, crit_link_match_offset = replace_match(
-                link_inside_crit_match,
-                link_inside_crit_match.group("name"),
-                crit_group,
-                crit_link_match_offset,
-            )
-        md_crit_list: list[bytes] = list()
-        for re_match in MARKDOWN_CRIT_PATTERN_SELF.finditer(crit_group):
-            crit = re_match.group("crit").strip()
-            tags.add(crit)
-            md_crit_list.append(b'{{< crit "' + crit + b'" >}}')
-        content, crit_match_offset = replace_match(
-            re_match_group, b"\n".join(md_crit_list), content, crit_match_offset
+        crit_group = MARKDOWN_LINK_PATTERN.sub(b"\\g<name>", crit_group)
+        crits = [re_match[CRIT_SELF_GROUP].strip() for re_match in MARKDOWN_CRIT_PATTERN_SELF.finditer(crit_group)]
+        tags.update(crits)
+        return b"\n".join([b'{{< crit "' + crit + b'" >}}' for crit in crits])
+
+    def repair_match(re_match_group: re.Match[bytes]) -> bytes:
+        if re_match_group.lastindex != LINK_GROUP:
+            return repair_crit(re_match_group[CRIT_CONTENT_GROUP])
+        link = repair_link(
+            re_match_group,
+            old_link_prefix,
+            resource_dir_names,
+            md_link=re_match_group[LINK_URL_GROUP].endswith(b".md"),
         )
-
-    logger.debug(f"Found {len(tags)} tags")
-    slug = urllib.parse.unquote_to_bytes(
-        repair_url_part(old_link_prefix).removesuffix(b".md")
-    )
-
+        # crits INSIDE the name of a link (the scan does not look into the matches)
+        if b"~~" in link:
+            link = MARKDOWN_CRIT_PATTERN.sub(lambda crit_match: repair_crit(crit_match["crit_group"]), link)
+        return link
+
+    # The content starts after the title. It is sliced (one copy): Pattern.sub has no start position, and re2 does
+    # not accept memoryview slices
+    content = content[content_start:]
+    # links contain '](' and crits contain both '~~' and 'crit': the content is left as is if there are none
+    # (pages with strikethrough text but no crits are common)
+    if b"](" in content or (b"~~" in content and b"crit" in content):
+        content = MARKDOWN_LINK_OR_CRIT_PATTERN.sub(repair_match, content)
+
+    logger.debug("Found %d tags", len(tags))
+    # old_link_prefix is already a repaired url part (repair_url_part is idempotent)
+    slug = unquote_url_part(old_link_prefix.removesuffix(b".md"))
+
+    # sorted, so that the output does not depend on the iteration order of the set
+    tags_list = b'"' + b'", "'.join(sorted(tags)) + b'"' if tags else b""
+
+    # the front matter and the content are joined in a single allocation
     return (
-        b"""---
-title: """
-        + title
-        + b"""
-slug: """
-        + slug
-        + b"""
-weight: """
-        + DEFAULT_WEIGHT
-        + b"""
-tags: [ """
-        + b", ".join(b'"' + tag + b'"' for tag in tags)
-        + b""" ]
----
-
-"""
-        + content,
+        b"".join(
+            (
+                b"---\ntitle: ",
+                title,
+                b"\nslug: ",
+                slug,
+                b"\nweight: ",
+                weight,
+                b"\ntags: [ ",
+                tags_list,
+                b" ]\n---\n\n",
+                content,
+            )
+        ),
         tags,
     )
 
@@ -222,9 +325,11 @@ tags: [ """
 def copy_file(
     src: bytes,
     dst: bytes,
-    resource_dir_names: list[bytes] | None = None,
+    resource_dir_names: frozenset[bytes] = frozenset(),
     force: bool = False,
-) -> set[bytes]:
+    content: bytes | None = None,
+    weight: bytes = DEFAULT_WEIGHT,
+) -> tuple[set[bytes], list[bytes]]:
     """
     Copy a file (src) to a destination path (dst). The content of the source file is modified and 'repaired'
     using the `repair_content` function.
@@ -233,20 +338,58 @@ def copy_file(
     :param dst: Destination path.
     :param resource_dir_names: The resource directories found in the same directory as the source file.
     :param force: The destination file can be overwritten.
-    :return: The list of tags found in the source file.
+    :param content: Content of the source file, if it has already been read (e.g. from a zip archive).
+    :param weight: Weight of the page.
+    :return: A tuple. The first element is the list of tags found in the source file. The second element is the
+    order of the links to the child pages (see `weights.link_order_from_content`).
     """
-    if os.path.exists(dst) and not force:
-        raise RuntimeError(f'File "{dst}" already exists. Use --force to overwrite')
+    if content is None:
+        # the whole file is read at once, so no read buffer is needed
+        with open(src, "rb", buffering=0) as infile:
+            content = infile.read()
+    repaired_content, tags = repair_content(content, src, dst, resource_dir_names, weight)
+    # the existence check and the creation of the file are done by the same system call
+    try:
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | (0 if force else os.O_EXCL), 0o666)
+    except FileExistsError:
+        raise RuntimeError(f'File "{dst}" already exists. Use --force to overwrite') from None
+    with open(fd, "wb") as outfile:
+        outfile.write(repaired_content)
 
-    if resource_dir_names is None:
-        resource_dir_names = []
+    return tags, link_order_from_content(repaired_content, os.path.dirname(dst))
+
+
+def init_worker(log_level: int) -> None:
+    """
+    Initialize a worker process of the markdown pool.
+    The level is set here, and not by passing `logger.setLevel` to the pool: this module (and so the logging
+    configuration, which sets the INFO level) has to be imported first in the spawned workers.
+
+    :param log_level: Level of the logger in the main process.
+    """
+    logger.setLevel(log_level)
 
-    with open(src, "rb") as infile, open(dst, "wb") as outfile:
-        content = infile.read()
-        repaired_content, tags = repair_content(content, src, dst, resource_dir_names)
-        outfile.write(repaired_content)
 
-    return tags
+def link_file(src: bytes, dst: bytes) -> None:
+    """
+    Hard link a resource file (src) to its destination path (dst), so that no data is copied.
+    The file is copied instead if it cannot be linked (e.g. the paths are on different file systems).
+
+    :param src: Source path.
+    :param dst: Destination path (overwritten if it exists).
+    """
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        if not os.path.isfile(dst):
+            # e.g. a directory with the same repaired name: the file is copied into it, like `shutil.copy` does
+            shutil.copy(src, dst)
+            return
+        # a hard link cannot replace an existing file
+        os.remove(dst)
+        link_file(src, dst)
+    except OSError:
+        shutil.copy(src, dst)
 
 
 def write_dm_tags_section(markdown_dir: bytes, tags: dict[bytes, bytes]) -> None:
@@ -281,129 +424,337 @@ def write_dm_tags_section(markdown_dir: bytes, tags: dict[bytes, bytes]) -> None
         index_file.write(additional_content)
 
 
-def extract_resource_dir_names(file_or_dir_names: list[bytes]) -> list[bytes]:
+def scan_dir(
+    input_dir: bytes, archive: Archive | None = None
+) -> list[os.DirEntry[bytes] | ArchiveEntry]:
+    """
+    List the files and directories of an input directory, which is either on disk or in a zip archive.
+
+    :param input_dir: Path of the directory.
+    :param archive: The zip archive in which `input_dir` is located (if None, `input_dir` is on disk).
+    :return: Directory entries of the files and directories.
+    """
+    if archive is not None:
+        return archive.scandir(input_dir)
+    with os.scandir(input_dir) as dir_entries:
+        return list(dir_entries)
+
+
+def extract_resource_dir_names(
+    entries: list[os.DirEntry[bytes] | ArchiveEntry],
+) -> dict[bytes, bytes]:
     """
     Extract the resource directory names from a list of files and directories.
     Markdown files will eventually be moved to a directory with the same name (without the .md suffix).
-    This function returns a list of directory names, which can be used in hyperlinks and other references.
-
-    :param file_or_dir_names: Names of files and directories.
-    :return: List of directory names.
-    """
-    resource_dir_names: list[bytes] = list()
-    for name in file_or_dir_names:
-        if os.path.isdir(name):
-            resource_dir_names.append(name)
-        elif name.endswith(b".md"):
-            resource_dir_names.append(name.removesuffix(b".md"))
-    resource_dir_names = list(
-        map(
-            lambda resource_dir_name: repair_url_part(repair_name(resource_dir_name)),
-            resource_dir_names,
-        )
-    )
-    return resource_dir_names
+    This function returns the (repaired) directory names, which can be used in hyperlinks and other references.
 
+    :param entries: Directory entries of files and directories.
+    :return: Dict that maps the names of the directories and markdown files to their repaired names (which are
+    also the names of their output directories).
+    """
+    return {
+        entry.name: repair_url_part(repair_name(entry.name).removesuffix(b".md"))
+        for entry in entries
+        if entry.is_dir() or entry.name.endswith(b".md")
+    }
 
-def beautify(
+
+def make_output_dir(path: bytes, force: bool = False) -> None:
+    """
+    Create an output directory. The directory is created right away (no `stat` call is needed when it does
+    not exist yet, which is the usual case).
+
+    :param path: Path of the directory.
+    :param force: The directory may already exist.
+    """
+    try:
+        os.mkdir(path)
+    except FileExistsError:
+        if not os.path.isdir(path):
+            raise
+        if not force:
+            raise RuntimeError(f'Directory "{path}" already exists. Use --force to overwrite') from None
+
+
+class MarkdownJob(NamedTuple):
+    """
+    Markdown file found while walking the input. It is repaired and written later on, by `copy_file`.
+    """
+
+    src: bytes
+    dst: bytes
+    resource_dir_names: frozenset[bytes]
+    content: bytes | None  # None if the file is read from disk
+    dm_tags: dict[bytes, bytes] | None  # tags of the DM in which the file is located (if any)
+    tag_value: bytes
+    depth: int  # depth of the destination directory
+
+
+def walk_input_dir(
     base_markdown_dir: bytes,
     input_dir: bytes,
     markdown_dir: bytes,
     static_dir: bytes,
+    markdown_jobs: list[MarkdownJob],
+    resource_jobs: list[tuple[bytes, bytes]],
+    markdown_dirs: list[bytes],
+    all_dm_tags: dict[bytes, dict[bytes, bytes]],
+    dm_tags: dict[bytes, bytes] | None = None,
     force: bool = False,
     depth: int = 0,
+    archive: Archive | None = None,
 ) -> None:
     """
-    Beautifies content from the `input_dir` and writes the output to the `markdown_dir` and `static_dir`.
+    Walks the `input_dir` and creates the output directories in the `markdown_dir` and `static_dir`.
+    Markdown files are added to `markdown_jobs` and resource files to `resource_jobs` (nothing is written yet).
 
     :param base_markdown_dir: Initial value of the `markdown_dir`.
     Since this is a recursive function, the value of `markdown_dir` will change.
     :param input_dir: Path to the directory that is currently being processed.
     :param markdown_dir: Path to the output directory for the markdown files.
     :param static_dir: Path to the output directory for the static files.
+    :param markdown_jobs: Markdown files that have been found so far.
+    :param resource_jobs: Resource files that have been found so far (source and destination paths).
+    :param markdown_dirs: Output directories for the markdown files that have been created so far (except the
+    `base_markdown_dir`).
+    :param all_dm_tags: Tags of each DM directory that has been found so far (filled once the jobs are done).
+    :param dm_tags: Tags of the DM directory in which `input_dir` is located (if any).
     :param force: Overwrite existing files.
     :param depth: Current depth (this is a recursive function).
+    :param archive: The zip archive in which `input_dir` is located (if None, `input_dir` is on disk).
     """
-    global g_all_dm_tags, g_dm_tags
-
-    def verb(*a):
-        logger.debug(" " * depth + " ".join(a))
+    def verb(msg: str, *args) -> None:
+        # the message is only formatted if it is actually logged
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(" " * depth + msg, *args)
 
     markdown_dir_basename = os.path.basename(markdown_dir)
     is_dm_dir = depth == 2 and markdown_dir_basename.startswith(b"dm-")
     if is_dm_dir:
-        g_dm_tags = dict()
+        dm_tags = all_dm_tags[markdown_dir_basename] = dict()
 
-    if not os.path.isdir(markdown_dir):
-        os.mkdir(markdown_dir)
-    elif not force:
-        raise RuntimeError(
-            f'Directory "{markdown_dir}" already exists. Use --force to overwrite'
-        )
-
-    if not os.path.isdir(static_dir):
-        os.mkdir(static_dir)
-    elif not force:
-        raise RuntimeError(
-            f'Directory "{static_dir}" already exists. Use --force to overwrite'
-        )
+    make_output_dir(markdown_dir, force)
+    make_output_dir(static_dir, force)
+    if markdown_dir != base_markdown_dir:
+        markdown_dirs.append(markdown_dir)
 
-    verb(f"input: {input_dir}, output: {markdown_dir}")
+    verb("input: %s, output: %s", input_dir, markdown_dir)
 
-    names = os.listdir(input_dir)
-    resource_dir_names = extract_resource_dir_names(names)
+    entries = scan_dir(input_dir, archive)
+    repaired_names = extract_resource_dir_names(entries)
+    # the links of every markdown file of the directory are checked against these names
+    resource_dir_names = frozenset(repaired_names.values())
 
-    # process directories first, then files
-    for name in sorted(names, key=lambda name_: 0 if os.path.isdir(name_) else 1):
+    # process directories first, then files (the file types are cached by the directory entries)
+    # entries are also sorted by name, since the order of scandir is arbitrary
+    entries.sort(key=lambda entry_: (not entry_.is_dir(), entry_.name))
+    for entry in entries:
+        name = entry.name
         # the first directory should not create a subdirectory
         if depth != 0:
             # markdown directory
-            repaired_name = repair_name(name).removesuffix(b".md")
-            repaired_name = repair_url_part(repaired_name)
-            markdown_repaired_dir = os.path.join(markdown_dir, repaired_name)
+            repaired_name = repaired_names.get(name)
+            if repaired_name is None:
+                # resource file
+                repaired_name = repair_url_part(repair_name(name).removesuffix(b".md"))
+            markdown_repaired_dir = markdown_dir + b"/" + repaired_name
             # static directory
-            static_repaired_dir = os.path.join(static_dir, repaired_name)
+            static_repaired_dir = static_dir + b"/" + repaired_name
 
-            verb(f"looking at {name} (repaired: {repaired_name})")
+            verb("looking at %s (repaired: %s)", name, repaired_name)
         else:
             markdown_repaired_dir = markdown_dir
             static_repaired_dir = static_dir
-        path = os.path.join(input_dir, name)
+        path = entry.path
 
-        if os.path.isdir(path):
-            verb(f"{os.path.basename(path)}: directory")
-            beautify(
+        if entry.is_dir():
+            verb("%s: directory", name)
+            walk_input_dir(
                 base_markdown_dir,
                 path,
                 markdown_repaired_dir,
                 static_repaired_dir,
+                markdown_jobs,
+                resource_jobs,
+                markdown_dirs,
+                all_dm_tags,
+                dm_tags,
                 force,
                 depth + 1,
+                archive,
             )
-        elif os.path.isfile(path):
+        elif entry.is_file():
             if name.endswith(b".md"):
-                if not os.path.isdir(markdown_repaired_dir):
-                    os.mkdir(markdown_repaired_dir)
-                verb(f"{os.path.basename(path)}: root markdown file")
-                if dst_file_tags := copy_file(
-                    path,
-                    os.path.join(markdown_repaired_dir, b"_index.md"),
-                    resource_dir_names,
-                    force,
-                ):
-                    # register all tags with the right markdown directory
-                    tag_value = os.path.relpath(markdown_repaired_dir, base_markdown_dir)
-                    for tag in dst_file_tags:
-                        g_dm_tags[tag] = tag_value
+                # the directory of a page may also be created for its subpages
+                make_output_dir(markdown_repaired_dir, True)
+                verb("%s: root markdown file", name)
+                markdown_jobs.append(
+                    MarkdownJob(
+                        path,
+                        markdown_repaired_dir + b"/_index.md",
+                        resource_dir_names,
+                        None if archive is None else archive.read(path),
+                        dm_tags,
+                        os.path.relpath(markdown_repaired_dir, base_markdown_dir),
+                        depth,
+                    )
+                )
             else:
-                # verb(f"{os.path.basename(path)}: resource file")
-                shutil.copy(path, static_repaired_dir)
+                # verb("%s: resource file", name)
+                if depth == 0:
+                    # the resources at the root of the export are copied with their name into the static directory
+                    static_repaired_dir = static_dir + b"/" + name
+                resource_jobs.append((path, static_repaired_dir))
         else:
             print(f"{path}: unknown type")
 
-    # collect tags
-    if depth == 2 and markdown_dir_basename.startswith(b"dm-"):
-        g_all_dm_tags[markdown_dir_basename] = g_dm_tags.copy()
+
+def beautify(
+    base_markdown_dir: bytes,
+    input_dir: bytes,
+    markdown_dir: bytes,
+    static_dir: bytes,
+    force: bool = False,
+    depth: int = 0,
+    archive: Archive | None = None,
+    link_resources: bool = False,
+) -> dict[bytes, dict[bytes, bytes]]:
+    """
+    Beautifies content from the `input_dir` and writes the output to the `markdown_dir` and `static_dir`.
+    The markdown files are independent of each other, so they are repaired in parallel once the input has been walked.
+    The resource files are copied beforehand, in threads (this is mostly I/O).
+
+    :param base_markdown_dir: Initial value of the `markdown_dir`.
+    :param input_dir: Path to the input directory.
+    :param markdown_dir: Path to the output directory for the markdown files.
+    :param static_dir: Path to the output directory for the static files.
+    :param force: Overwrite existing files.
+    :param depth: Depth of the input directory.
+    :param archive: The zip archive in which `input_dir` is located (if None, `input_dir` is on disk).
+    :param link_resources: Hard link the resource files instead of copying them. Only do this if `input_dir` is a
+    folder of our own (e.g. a tmp folder): the output would otherwise share its files with the user's input.
+    :return: The tags of each DM directory. The keys are the DM directory names and the values map tag names to
+    tag links (see `write_dm_tags_section`).
+    """
+    markdown_jobs: list[MarkdownJob] = list()
+    resource_jobs: list[tuple[bytes, bytes]] = list()
+    markdown_dirs: list[bytes] = list()
+    all_dm_tags: dict[bytes, dict[bytes, bytes]] = dict()
+    walk_input_dir(
+        base_markdown_dir,
+        input_dir,
+        markdown_dir,
+        static_dir,
+        markdown_jobs,
+        resource_jobs,
+        markdown_dirs,
+        all_dm_tags,
+        force=force,
+        depth=depth,
+        archive=archive,
+    )
+
+    # the copies are done before the process pool is started, so that no thread is running when it forks
+    if archive is not None:
+        copy_resource = archive.copy
+    elif link_resources:
+        copy_resource = link_file
+    else:
+        copy_resource = shutil.copy
+    # resources which are repaired to the same path would be written concurrently: only the last one (in the order of
+    # the walk) is copied, since it would overwrite the others anyway
+    resource_srcs = {dst: src for src, dst in resource_jobs}
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        futures = [executor.submit(copy_resource, src, dst) for dst, src in resource_srcs.items()]
+        for future in futures:
+            future.result()
+
+    # The weight of a page is given by the order of the links in its parent page. The markdown files are
+    # processed one depth at a time, so that the weights are known before the pages are written.
+    jobs_tags: list[set[bytes]] = [set() for _ in markdown_jobs]
+    page_weights: dict[bytes, int] = dict()
+    # Pages which are repaired to the same path are not written by concurrent workers (the file could end up with
+    # mixed contents): they are written one after the other, in the order of the walk, so that the last one wins
+    dst_counts: dict[bytes, int] = dict()
+    for job in markdown_jobs:
+        dst_counts[job.dst] = dst_counts.get(job.dst, 0) + 1
+
+    def copy_files(map_function, job_indices: list[int], job_weights: dict[bytes, bytes], **map_kwargs):
+        jobs = [markdown_jobs[job_index] for job_index in job_indices]
+        return map_function(
+            copy_file,
+            [job.src for job in jobs],
+            [job.dst for job in jobs],
+            [job.resource_dir_names for job in jobs],
+            itertools.repeat(force),
+            [job.content for job in jobs],
+            [job_weights.get(job.dst, DEFAULT_WEIGHT) for job in jobs],
+            **map_kwargs,
+        )
+
+    max_workers = os.cpu_count() or 1
+    # the workers do not inherit the level of the logger with the 'spawn' and 'forkserver' start methods
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers, initializer=init_worker, initargs=(logger.level,)
+    ) as executor:
+        for jobs_depth in sorted(set(job.depth for job in markdown_jobs)):
+            depth_job_indices = [
+                job_index for job_index, job in enumerate(markdown_jobs) if job.depth == jobs_depth
+            ]
+            depth_weights = {
+                markdown_jobs[job_index].dst: bytes(str(page_weights.pop(markdown_jobs[job_index].dst)), "utf-8")
+                for job_index in depth_job_indices
+                if markdown_jobs[job_index].dst in page_weights
+            }
+            parallel_job_indices = [
+                job_index for job_index in depth_job_indices if dst_counts[markdown_jobs[job_index].dst] == 1
+            ]
+            serial_job_indices = [
+                job_index for job_index in depth_job_indices if dst_counts[markdown_jobs[job_index].dst] > 1
+            ]
+            results = copy_files(
+                executor.map,
+                parallel_job_indices,
+                depth_weights,
+                # the jobs are sent to the workers in batches (a few per worker), instead of one by one
+                chunksize=max(1, len(parallel_job_indices) // (4 * max_workers)),
+            )
+            # the serial jobs are only started once all the parallel results are in
+            results = itertools.chain(list(results), copy_files(map, serial_job_indices, depth_weights))
+            for job_index, (tags, link_order) in zip(parallel_job_indices + serial_job_indices, results):
+                jobs_tags[job_index] = tags
+                # the pages of the top directory have no weight
+                if jobs_depth == 0:
+                    continue
+                markdown_repaired_dir = os.path.dirname(markdown_jobs[job_index].dst)
+                for link_weight, link_target in enumerate(link_order, 1):
+                    logger.debug("Setting weight of %s to %d", link_target, link_weight)
+                    page_weights[markdown_repaired_dir + b"/" + link_target + b"/_index.md"] = link_weight
+
+    # the weights of the children of a directory are given by its '_index.md' file, which must exist
+    generated_pages = set(job.dst for job in markdown_jobs)
+    for markdown_dir_ in dict.fromkeys(markdown_dirs):
+        index_file_path = markdown_dir_ + b"/_index.md"
+        if index_file_path not in generated_pages and not os.path.isfile(index_file_path):
+            logger.error(
+                f"Failed to parse {index_file_path} to set the children's weights. File does not exist"
+            )
+            set_exit_status(1)
+
+    # links to pages that have not been generated now (they may already exist)
+    for target_file_path, link_weight in page_weights.items():
+        set_page_weight(target_file_path, link_weight)
+
+    # register all tags with the right markdown directory (in the order in which the files were found)
+    for job, tags in zip(markdown_jobs, jobs_tags):
+        if job.dm_tags is None:
+            continue
+        # sorted, so that the order of the tags section does not depend on the iteration order of the set
+        for tag in sorted(tags):
+            job.dm_tags[tag] = job.tag_value
+
+    return all_dm_tags
+
 
 def main():
     parser = argparse.ArgumentParser(description="unzip notion exports")
@@ -490,6 +841,7 @@ def main():
 
     input_dir: bytes
     tmp_folder: tempfile.TemporaryDirectory[str] | None = None
+    archive: Archive | None = None
     if args.source:
         if not os.path.isdir(args.input):
             raise NotADirectoryError("Input is not a directory")
@@ -497,10 +849,15 @@ def main():
     else:
         if not os.path.isfile(args.input):
             raise FileNotFoundError("Input is not a file")
-        tmp_folder = tempfile.TemporaryDirectory(prefix="unzip-notion-")
-        with zipfile.ZipFile(args.input, "r") as zip_ref:
-            zip_ref.extractall(tmp_folder.name)
-        input_dir = bytes(tmp_folder.name, "utf-8")
+        if args.keep_tmp_folder:
+            tmp_folder = tempfile.TemporaryDirectory(prefix="unzip-notion-")
+            input_dir = bytes(tmp_folder.name, "utf-8")
+            with zipfile.ZipFile(args.input, "r") as zip_ref:
+                Archive(zip_ref).extractall(input_dir)
+        else:
+            # the files are read directly from the zip file, and written once to their final destination
+            archive = Archive(zipfile.ZipFile(args.input, "r"))
+            input_dir = b""
 
     # Generate content and static directories
     output_dir = bytes(args.hugo_dir, "utf-8")
@@ -512,10 +869,13 @@ def main():
     if args.dm:
         logger.debug("DM mode is enabled. Trying to figure out what the output path is...")
         dm_files = set(
-            filter(lambda f: f.endswith(b".md") and os.path.isfile(os.path.join(input_dir, f)), os.listdir(input_dir)))
+            entry.name
+            for entry in scan_dir(input_dir, archive)
+            if entry.name.endswith(b".md") and entry.is_file()
+        )
         if len(dm_files) != 1:
-            logger.error(f"No files in '{input_dir}'. Please make sure this is the export of a DM.")
-            raise RuntimeError(f"'{input_dir}' is not a DM export.")
+            logger.error(f"No files in '{args.input}'. Please make sure this is the export of a DM.")
+            raise RuntimeError(f"'{args.input}' is not a DM export.")
         dm_folder_name = repair_url_part(repair_name(dm_files.pop())).removesuffix(b".md")
         dm_content_output_dir = os.path.join(content_output_dir, dm_folder_name)
         dm_static_output_dir = os.path.join(static_output_dir, dm_folder_name)
@@ -538,30 +898,41 @@ def main():
             shutil.rmtree(dm_static_output_dir, ignore_errors=True)
 
     # main function
+    # the resource files are only linked from the tmp folder (never from the user's --source directory)
     if not args.dm:
-        beautify(
-            content_output_dir, input_dir, content_output_dir, static_output_dir, args.force
+        all_dm_tags = beautify(
+            content_output_dir,
+            input_dir,
+            content_output_dir,
+            static_output_dir,
+            args.force,
+            archive=archive,
+            link_resources=tmp_folder is not None,
         )
     else:
-        beautify(
-            content_output_dir, input_dir, content_output_dir, static_output_dir, args.force, depth=1
+        all_dm_tags = beautify(
+            content_output_dir,
+            input_dir,
+            content_output_dir,
+            static_output_dir,
+            args.force,
+            depth=1,
+            archive=archive,
+            link_resources=tmp_folder is not None,
         )
 
     # write tags
-    for dm_dir_name, tag_dict in g_all_dm_tags.items():
-        logger.debug(f"Found {len(g_dm_tags)} tags for {dm_dir_name}")
+    for dm_dir_name, tag_dict in all_dm_tags.items():
+        logger.debug(f"Found {len(tag_dict)} tags for {dm_dir_name}")
         write_dm_tags_section(os.path.join(content_output_dir, dm_dir_name), tag_dict)
 
-    # write weights
-    set_weights(content_output_dir)
-
     # Clean up file generation
+    if archive:
+        archive.close()
+    # the tmp folder only exists with --keep-tmp-folder (it is removed when the program exits)
     if tmp_folder:
-        if args.keep_tmp_folder:
-            print(f"Not removing the tmp folder: {tmp_folder}")
-            shutil.copytree(tmp_folder.name, os.path.join("/tmp", "unzip-notion"))
-        else:
-            tmp_folder.cleanup()
+        print(f"Not removing the tmp folder: {tmp_folder}")
+        shutil.copytree(tmp_folder.name, os.path.join("/tmp", "unzip-notion"))
 
     # Overwrite
     # This code is written in a way that makes future implementations of the --overwrite option easier
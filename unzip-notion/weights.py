@@ -2,33 +2,38 @@ import os
 import re
 
 from logger import logger
-from utils import set_exit_status, replace_match
+from utils import set_exit_status
 
 MARKDOWN_DIR_LINK_PATTERN = re.compile(b"\\[(?P<name>[^]]*)]\\((?P<url>[^)/]+)\\)")
+DIR_LINK_URL_GROUP = MARKDOWN_DIR_LINK_PATTERN.groupindex["url"]
 
 DEFAULT_WEIGHT = b"99"
+DEFAULT_WEIGHT_PATTERN = re.compile(b"^weight: " + DEFAULT_WEIGHT + b"$", re.MULTILINE)
 
 
-def link_order_from_index_file(
-    index_file_path: bytes, markdown_dir: bytes
-) -> list[bytes]:
+def link_order_from_content(content: bytes, markdown_dir: bytes) -> list[bytes]:
     """
-    Extracts the list of references to other markdown files. This list is ordered by appearance in the file.
+    Extracts the list of references to other markdown files. This list is ordered by appearance in the content.
 
-    :param index_file_path: Input file.
-    :param markdown_dir: Directory containing the input file (`index_file_path`).
+    :param content: Content of the '_index.md' file of `markdown_dir`.
+    :param markdown_dir: Directory containing the '_index.md' file.
     :return: List of references to other markdown files.
     """
-    with open(index_file_path, "rb") as index_file:
-        content = index_file.read()
     link_order = list()
+    seen_link_targets: set[bytes] = set()
+    # subdirectories of `markdown_dir`, listed once (on the first link)
+    subdir_names: set[bytes] | None = None
     for re_match in MARKDOWN_DIR_LINK_PATTERN.finditer(content):
-        link_target = re_match.group("url")
-        if link_target in link_order or not os.path.isdir(
-            os.path.join(markdown_dir, link_target)
-        ):
+        link_target = re_match[DIR_LINK_URL_GROUP]
+        if link_target in seen_link_targets:
             continue
-        logger.debug(f"Found direct link in {index_file_path}: {link_target}")
+        seen_link_targets.add(link_target)
+        if subdir_names is None:
+            with os.scandir(markdown_dir) as entries:
+                subdir_names = {entry.name for entry in entries if entry.is_dir()}
+        if link_target not in subdir_names:
+            continue
+        logger.debug("Found direct link in %s: %s", markdown_dir, link_target)
         link_order.append(link_target)
     return link_order
 
@@ -40,7 +45,10 @@ def set_page_weight(target_file_path: bytes, link_weight: int) -> None:
     :param target_file_path: Input file.
     :param link_weight: Weight.
     """
-    if not os.path.isfile(target_file_path):
+    try:
+        with open(target_file_path, "rb") as target_file:
+            content = target_file.read()
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
         if not target_file_path.endswith(b".png"):
             logger.error(
                 f"File (target of link) {target_file_path} does not exist. "
@@ -48,50 +56,15 @@ def set_page_weight(target_file_path: bytes, link_weight: int) -> None:
             )
             set_exit_status(1)
         return
-    with open(target_file_path, "rb") as target_file:
-        content = target_file.read()
-    weight_re_match = re.search(
-        b"^weight: " + DEFAULT_WEIGHT + b"$", content, re.MULTILINE
-    )
-    if weight_re_match is None:
+    weight = bytes(str(link_weight), "utf-8")
+    content, replacements = DEFAULT_WEIGHT_PATTERN.subn(b"weight: " + weight, content, count=1)
+    if not replacements:
         logger.warning(f"No weight tag found for {target_file_path}")
         return
-    content, __ = replace_match(
-        weight_re_match, b"weight: " + bytes(str(link_weight), "utf-8"), content
-    )
+    # the file would be left unchanged
+    if weight == DEFAULT_WEIGHT:
+        return
     with open(target_file_path, "wb") as target_file:
         target_file.write(content)
-    logger.debug(f"Updated weight to {link_weight} for {target_file_path}")
-
-
-def set_weights(markdown_dir: bytes, depth: int = 0) -> None:
-    """
-    Set the right weights for all the files in `markdown_dir`.
+    logger.debug("Updated weight to %s for %s", link_weight, target_file_path)
 
-    :param markdown_dir: Input directory.
-    :param depth: Current depth (this is a recursive function).
-    """
-    for name in os.listdir(markdown_dir):
-        child_path = os.path.join(markdown_dir, name)
-        if os.path.isdir(child_path):
-            set_weights(child_path, depth + 1)
-
-    # set weights of pages depending on the order of the links
-    # in the current directory's _index.md file
-    if depth != 0:
-        child_path = os.path.join(markdown_dir, b"_index.md")
-        try:
-            # figure out the order of links in the current file
-            link_order = link_order_from_index_file(child_path, markdown_dir)
-        except FileNotFoundError:
-            logger.error(
-                f"Failed to parse {child_path} to set the children's weights. File does not exist"
-            )
-            set_exit_status(1)
-        else:
-            # iterate once again over the all subdirectories and write weight values
-            for link_weight, link_target in enumerate(link_order, 1):
-                logger.debug(f"Setting weight of {link_target} to {link_weight}")
-                set_page_weight(
-                    os.path.join(markdown_dir, link_target, b"_index.md"), link_weight
-                )